@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# Zed Attack Proxy (ZAP) and its related class files.
+#
+# ZAP is an HTTP/HTTPS proxy for assessing web application security.
+#
+# Copyright 2017 ZAP Development Team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Tests for zap_common, run with: python -m unittest discover tests
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from six.moves import BaseHTTPServer, socketserver
+from zapv2 import ZAPv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from zap_common import *
+
+
+class FakeZapHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Answers every proxied request with a ZAP API version response, counting the connections """
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+
+    def handle(self):
+        FakeZapHandler.connections += 1
+        BaseHTTPServer.BaseHTTPRequestHandler.handle(self)
+
+    def do_GET(self):
+        if 'missing' in self.path:
+            self.send_error(404)
+            return
+        if 'truncated' in self.path:
+            # promise more than is sent, then drop the connection
+            self.send_response(200)
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            self.wfile.write(b'partial')
+            self.close_connection = True
+            return
+        body = b'{"version": "2.7.0"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeZapServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class ZapUseSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        FakeZapHandler.connections = 0
+        self.server = FakeZapServer(('127.0.0.1', 0), FakeZapHandler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_api_calls_reuse_one_connection(self):
+        proxy = 'http://127.0.0.1:' + str(self.port)
+        zap = ZAPv2(proxies={'http': proxy, 'https': proxy})
+        zap_use_session(zap, zap_session('127.0.0.1', self.port))
+
+        for x in range(0, 5):
+            self.assertEqual(zap.core.version, '2.7.0')
+
+        self.assertEqual(FakeZapHandler.connections, 1)
+
+    def test_api_rejects_non_zap_urls(self):
+        zap = ZAPv2()
+        zap_use_session(zap, zap_session('127.0.0.1', self.port))
+
+        self.assertRaises(ValueError, zap._request_api, 'http://example.com/')
+
+
+class WriteReportsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeZapServer(('127.0.0.1', 0), FakeZapHandler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever).start()
+        self.report_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.report_dir)
+
+    def test_reports_written_and_failures_skipped(self):
+        html_report = os.path.join(self.report_dir, 'report.html')
+        missing_report = os.path.join(self.report_dir, 'missing.xml')
+        write_reports('127.0.0.1', self.port, [
+            (html_report, 'http://zap/OTHER/core/other/htmlreport/'),
+            (missing_report, 'http://zap/OTHER/core/other/missing/')])
+
+        with open(html_report, 'rb') as f:
+            self.assertEqual(f.read(), b'{"version": "2.7.0"}')
+        self.assertFalse(os.path.exists(missing_report))
+
+    def test_truncated_report_keeps_previous_report(self):
+        xml_report = os.path.join(self.report_dir, 'report.xml')
+        with open(xml_report, 'wb') as f:
+            f.write(b'previous report')
+
+        write_reports('127.0.0.1', self.port, [(xml_report, 'http://zap/OTHER/core/other/truncated/')])
+
+        with open(xml_report, 'rb') as f:
+            self.assertEqual(f.read(), b'previous report')
+        self.assertEqual(os.listdir(self.report_dir), ['report.xml'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,27 +50,74 @@ import getopt
 import logging
 import os
 import os.path
+import requests
 import sys
 import time
-from datetime import datetime
+from six.moves.urllib.parse import urlsplit
 from six.moves.urllib.request import urlopen
 from zapv2 import ZAPv2
 from zap_common import *
 
-from selenium import webdriver
-from pyvirtualdisplay import Display
-
 config_dict = {}
 config_msg = {}
 out_of_scope_dict = {}
 min_level = 0
+pass_level = zap_conf_lvls.index('PASS')
 
 # Pscan rules that aren't really relevant, eg the examples rules in the alpha set
-blacklist = ['-1', '50003', '60000', '60001']
+blacklist = frozenset(['-1', '50003', '60000', '60001'])
 
 # Pscan rules that are being addressed
 in_progress_issues = {}
 
+# Maps the command line options to the main() setting they set, its default value
+# and how the option argument is converted into that setting
+option_settings = {
+    '-t': ('target', '', str),
+    '-c': ('config_file', '', str),
+    '-u': ('config_url', '', str),
+    '-g': ('generate', '', str),
+    '-m': ('mins', 1, int),
+    '-P': ('port', 0, int),
+    '-D': ('delay', 0, int),
+    '-T': ('timeout', 0, int),
+    '-n': ('context_file', '', str),
+    '-p': ('progress_file', '', str),
+    '-r': ('report_html', '', str),
+    '-J': ('report_json', '', str),
+    '-w': ('report_md', '', str),
+    '-x': ('report_xml', '', str),
+    '-a': ('zap_alpha', False, lambda arg: True),
+    '-i': ('info_unspecified', False, lambda arg: True),
+    '-j': ('ajax', False, lambda arg: True),
+    '-z': ('zap_options', '', str),
+    '-s': ('detailed_output', True, lambda arg: False),
+    '--auth-first-page': ('auth_first_page', False, lambda arg: True),
+    '--auth-url': ('auth_login_url', '', str),
+    '--auth-username': ('auth_username', '', str),
+    '--auth-password': ('auth_password', '', str),
+    '--auth-username-field': ('auth_username_field', 'email', str),
+    '--auth-password-field': ('auth_password_field', 'password', str),
+    '--auth-submit-field': ('auth_submit_field', '', str),
+    '--auth-first-submit-field': ('auth_first_submit_field', '', str),
+    '--auth-exclude-urls': ('auth_exclude_urls', [], lambda arg: arg.split(',')),
+}
+
+# Sets the values of the named fields, firing the events a user typing them would,
+# then clicks the element matched by the xpath. The native value setter is used as
+# frameworks such as React ignore values assigned directly to their inputs.
+FILL_AND_SUBMIT_JS = '''
+var fields = arguments[0];
+var setValue = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set;
+for (var name in fields) {
+    var field = document.getElementsByName(name)[0];
+    setValue.call(field, fields[name]);
+    field.dispatchEvent(new Event('input', {bubbles: true}));
+    field.dispatchEvent(new Event('change', {bubbles: true}));
+}
+document.evaluate(arguments[1], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue.click();
+'''
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
 # Hide "Starting new HTTP connection" messages
 logging.getLogger("requests").setLevel(logging.WARNING)
@@ -114,40 +161,34 @@ def usage():
     print ('For more details see https://github.com/zaproxy/zaproxy/wiki/ZAP-Baseline-Scan')
 
 
+def submit_xpath(submit_field):
+    if submit_field:
+        return "//*[@name='" + submit_field + "' or @value='" + submit_field + "']"
+    # the first button or input with "submit" type
+    return "//*[@type='submit']"
+
+
+def fill_and_submit(driver, fields, submit_field):
+    """ Fills in the named form fields and clicks the submit element in a single script call
+    once they are all present
+    fields - a dictionary which maps field names to the values to enter
+    submit_field - the name or value of the submit element, or '' for the first submit button
+    """
+    xpath = submit_xpath(submit_field)
+    # execute_script doesn't use the implicit wait, so wait for the form to be rendered first
+    for name in fields:
+        driver.find_element_by_name(name)
+    driver.find_element_by_xpath(xpath)
+    driver.execute_script(FILL_AND_SUBMIT_JS, fields, xpath)
+
+
 def main(argv):
     global min_level
     global in_progress_issues
     cid = ''
-    context_file = ''
-    progress_file = ''
-    config_file = ''
-    config_url = ''
-    generate = ''
-    mins = 1
-    port = 0
-    detailed_output = True
-    report_html = ''
-    report_md = ''
-    report_xml = ''
-    report_json = ''
-    target = ''
-    zap_alpha = False
-    info_unspecified = False
-    ajax = False
+    in_docker = running_in_docker()
     base_dir = ''
     zap_ip = 'localhost'
-    zap_options = ''
-    delay = 0
-    timeout = 0
-    auth_first_page = False
-    auth_login_url = ''
-    auth_username = ''
-    auth_password = ''
-    auth_username_field = 'email'
-    auth_password_field = 'password'
-    auth_submit_field = ''
-    auth_first_submit_field = ''
-    auth_exclude_urls = [];
     pass_count = 0
     warn_count = 0
     fail_count = 0
@@ -165,60 +206,10 @@ def main(argv):
         usage()
         sys.exit(3)
 
+    settings = dict((name, default) for (name, default, convert) in option_settings.values())
     for opt, arg in opts:
-        if opt == '-t':
-            target = arg
-            logging.debug('Target: ' + target)
-        elif opt == '-c':
-            config_file = arg
-        elif opt == '-u':
-            config_url = arg
-        elif opt == '-g':
-            generate = arg
-        elif opt == '-d':
+        if opt == '-d':
             logging.getLogger().setLevel(logging.DEBUG)
-        elif opt == '-m':
-            mins = int(arg)
-        elif opt == '-P':
-            port = int(arg)
-        elif opt == '-D':
-            delay = int(arg)
-        elif opt == '-n':
-            context_file = arg
-        elif opt == '-p':
-            progress_file = arg
-        elif opt == '-r':
-            report_html = arg
-        elif opt == '-J':
-            report_json = arg
-        elif opt == '-w':
-            report_md = arg
-        elif opt == '-x':
-            report_xml = arg
-        elif opt == '-a':
-            zap_alpha = True
-        elif opt == '-i':
-            info_unspecified = True
-        elif opt == '-j':
-            ajax = True
-        elif opt == '--auth-first-page':
-            auth_first_page = True
-        elif opt == "--auth-username":
-            auth_username = arg
-        elif opt == "--auth-password":
-            auth_password = arg
-        elif opt == "--auth-url":
-            auth_login_url = arg
-        elif opt == "--auth-username-field":
-            auth_username_field = arg
-        elif opt == "--auth-password-field":
-            auth_password_field = arg
-        elif opt == "--auth-submit-field":
-            auth_submit_field = arg
-        elif opt == "--auth-first-submit-field":
-            auth_first_submit_field = arg
-        elif opt == "--auth-exclude-urls":
-            auth_exclude_urls = arg.split(',')
         elif opt == '-l':
             try:
                 min_level = zap_conf_lvls.index(arg)
@@ -226,24 +217,51 @@ def main(argv):
                 logging.warning('Level must be one of ' + str(zap_conf_lvls))
                 usage()
                 sys.exit(3)
-        elif opt == '-z':
-            zap_options = arg
-        elif opt == '-s':
-            detailed_output = False
-        elif opt == '-T':
-            timeout = int(arg)
+        else:
+            (name, default, convert) = option_settings[opt]
+            settings[name] = convert(arg)
+
+    target = settings['target']
+    config_file = settings['config_file']
+    config_url = settings['config_url']
+    generate = settings['generate']
+    mins = settings['mins']
+    port = settings['port']
+    delay = settings['delay']
+    timeout = settings['timeout']
+    context_file = settings['context_file']
+    progress_file = settings['progress_file']
+    report_html = settings['report_html']
+    report_json = settings['report_json']
+    report_md = settings['report_md']
+    report_xml = settings['report_xml']
+    zap_alpha = settings['zap_alpha']
+    info_unspecified = settings['info_unspecified']
+    ajax = settings['ajax']
+    zap_options = settings['zap_options']
+    detailed_output = settings['detailed_output']
+    auth_first_page = settings['auth_first_page']
+    auth_login_url = settings['auth_login_url']
+    auth_username = settings['auth_username']
+    auth_password = settings['auth_password']
+    auth_username_field = settings['auth_username_field']
+    auth_password_field = settings['auth_password_field']
+    auth_submit_field = settings['auth_submit_field']
+    auth_first_submit_field = settings['auth_first_submit_field']
+    auth_exclude_urls = settings['auth_exclude_urls']
+    logging.debug('Target: %s', target)
 
     # Check target supplied and ok
     if len(target) == 0:
         usage()
         sys.exit(3)
 
-    if not (target.startswith('http://') or target.startswith('https://')):
+    if not target.startswith(('http://', 'https://')):
         logging.warning('Target must start with \'http://\' or \'https://\'')
         usage()
         sys.exit(3)
 
-    if running_in_docker():
+    if in_docker:
         base_dir = '/zap/wrk/'
         if config_file or generate or report_html or report_xml or report_json or progress_file or context_file:
             # Check directory has been mounted
@@ -256,7 +274,7 @@ def main(argv):
     if port == 0:
         port = get_free_port()
 
-    logging.debug('Using port: ' + str(port))
+    logging.debug('Using port: %s', port)
 
     if config_file:
         # load config file from filestore
@@ -269,7 +287,14 @@ def main(argv):
     elif config_url:
         # load config file from url
         try:
-            load_config(urlopen(config_url).read().decode('UTF-8'), config_dict, config_msg, out_of_scope_dict)
+            if urlsplit(config_url).scheme in ('http', 'https'):
+                response = requests.get(config_url, timeout=30)
+                response.raise_for_status()
+                config = response.content
+            else:
+                # requests only handles http(s), urlopen also reads file:// and ftp:// urls
+                config = urlopen(config_url).read()
+            load_config(config.decode('UTF-8'), config_dict, config_msg, out_of_scope_dict)
         except ValueError as e:
             logging.warning(e)
             sys.exit(3)
@@ -279,15 +304,13 @@ def main(argv):
 
     if progress_file:
         # load progress file from filestore
-        with open(base_dir + progress_file) as f:
-            progress = json.load(f)
+        with open(base_dir + progress_file, 'rb') as f:
+            progress = json_loads(f.read())
             # parse into something more useful...
             # in_prog_issues = map of vulnid -> {object with everything in}
-            for issue in progress["issues"]:
-                if issue["state"] == "inprogress":
-                    in_progress_issues[issue["id"]] = issue
+            in_progress_issues = {issue["id"]: issue for issue in progress["issues"] if issue["state"] == "inprogress"}
 
-    if running_in_docker():
+    if in_docker:
         try:
             params = [
                       '-config', 'spider.maxDuration=' + str(mins),
@@ -295,8 +318,7 @@ def main(argv):
                       '-addoninstall', 'pscanrulesBeta']  # In case we're running in the stable container
 
             if zap_alpha:
-                params.append('-addoninstall')
-                params.append('pscanrulesAlpha')
+                params.extend(['-addoninstall', 'pscanrulesAlpha'])
 
             if zap_options:
                 for zap_opt in zap_options.split(" "):
@@ -328,13 +350,14 @@ def main(argv):
         try:
             cid = start_docker_zap('owasp/zap2docker-weekly', port, params, mount_dir)
             zap_ip = ipaddress_for_cid(cid)
-            logging.debug('Docker ZAP IP Addr: ' + zap_ip)
+            logging.debug('Docker ZAP IP Addr: %s', zap_ip)
         except OSError:
             logging.warning('Failed to start ZAP in docker :(')
             sys.exit(3)
 
     try:
         zap = ZAPv2(proxies={'http': 'http://' + zap_ip + ':' + str(port), 'https': 'http://' + zap_ip + ':' + str(port)})
+        zap_use_session(zap, zap_session(zap_ip, port))
 
         wait_for_zap_start(zap, timeout * 60)
 
@@ -346,14 +369,18 @@ def main(argv):
 
         zap_access_target(zap, target)
 
-        if target.count('/') > 2:
-            # The url can include a valid path, but always reset to spider the host
-            target = target[0:target.index('/', 8)+1]
+        # The url can include a valid path, but always reset to spider the host
+        target_parts = urlsplit(target)
+        target = target_parts.scheme + '://' + target_parts.netloc + '/'
 
         time.sleep(2)
 
         # Create logged in session
         if auth_login_url:
+            # only needed for authentication, so not imported for every scan
+            from selenium import webdriver
+            from pyvirtualdisplay import Display
+
             logging.debug ('Setup a new context')
 
             # create a new context
@@ -361,12 +388,12 @@ def main(argv):
 
             # include everything below the target
             zap.context.include_in_context('auth', "\\Q" + target + "\\E.*")
-            logging.debug ('Context - included ' + target + ".*")
+            logging.debug ('Context - included %s.*', target)
 
             # set excluded URLs
             for exclude in auth_exclude_urls:
                 zap.context.exclude_from_context('auth', exclude)
-                logging.debug ('Context - excluded ' + exclude)
+                logging.debug ('Context - excluded %s', exclude)
 
             # set the context in scope
             zap.context.set_context_in_scope('auth', True)
@@ -397,31 +424,21 @@ def main(argv):
             driver.implicitly_wait(30)
 
             # authenticate
-            logging.debug ('Authenticate using webdriver ' + auth_login_url)
+            logging.debug ('Authenticate using webdriver %s', auth_login_url)
             driver.get(auth_login_url)
 
+            fields = {}
             if auth_username:
-                driver.find_element_by_name(auth_username_field).clear()
-                driver.find_element_by_name(auth_username_field).send_keys(auth_username)
+                fields[auth_username_field] = auth_username
 
             if auth_first_page:
-                if auth_first_submit_field != '':
-                    first_submit_xpath = "//*[@name='" + auth_first_submit_field + "' or @value='" + auth_first_submit_field +"']"
-                    driver.find_element_by_name(first_submit_xpath).click()
-                else:
-                    # click on first button or input with "submit" type
-                    driver.find_element_by_xpath("//*[@type='submit']").click()
+                fill_and_submit(driver, fields, auth_first_submit_field)
+                fields = {}
 
             if auth_password:
-                driver.find_element_by_name(auth_password_field).clear()
-                driver.find_element_by_name(auth_password_field).send_keys(auth_password)
+                fields[auth_password_field] = auth_password
 
-            if auth_submit_field != '':
-                submit_xpath = "//*[@name='" + auth_submit_field + "' or @value='" + auth_submit_field +"']"
-                driver.find_element_by_xpath(submit_xpath).click()
-            else:
-                # click on first button or input with "submit" type
-                driver.find_element_by_xpath("//*[@type='submit']").click()
+            fill_and_submit(driver, fields, auth_submit_field)
 
             # Create a new session using the aquired cookies from the authentication
             logging.debug ('Create an authenticated session')
@@ -430,11 +447,13 @@ def main(argv):
             # add all found cookies as session cookies
             for cookie in driver.get_cookies():
                 zap.httpsessions.set_session_token_value(target, 'auth-session', cookie['name'], cookie['value'])
-                logging.debug ('Cookie found: ' + cookie['name'] + ' - Value: ' + cookie['value'])
+                logging.debug ('Cookie found: %s - Value: %s', cookie['name'], cookie['value'])
 
             # Mark the session as active
             zap.httpsessions.set_active_session(target, 'auth-session')
-            logging.debug ('Active session: ' + zap.httpsessions.active_session(target))
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                # only ask ZAP for the active session when it will be logged
+                logging.debug ('Active session: %s', zap.httpsessions.active_session(target))
 
             driver.quit()
             display.stop()
@@ -451,10 +470,8 @@ def main(argv):
             zap_ajax_spider(zap, target, mins)
 
         if (delay):
-            start_scan = datetime.now()
-            while ((datetime.now() - start_scan).seconds < delay):
-                time.sleep(5)
-                logging.debug('Delay passive scan check ' + str(delay - (datetime.now() - start_scan).seconds) + ' seconds')
+            logging.debug('Delay passive scan check %d seconds', delay)
+            time.sleep(delay)
 
         zap_wait_for_passive_scan(zap, timeout * 60)
 
@@ -468,13 +485,17 @@ def main(argv):
 
             alert_dict = zap_get_alerts(zap, target, blacklist, out_of_scope_dict)
 
-            all_rules = zap.pscan.scanners
+            # all the rules, and those which passed (raised no alerts)
             all_dict = {}
-            for rule in all_rules:
+            pass_dict = {}
+            for rule in zap.pscan.scanners:
                 plugin_id = rule.get('id')
                 if plugin_id in blacklist:
                     continue
-                all_dict[plugin_id] = rule.get('name')
+                name = rule.get('name')
+                all_dict[plugin_id] = name
+                if plugin_id not in alert_dict:
+                    pass_dict[plugin_id] = name
 
             if generate:
                 # Create the config file
@@ -487,17 +508,8 @@ def main(argv):
                         f.write(key + '\tWARN\t(' + rule + ')\n')
 
             # print out the passing rules
-            pass_dict = {}
-            for rule in all_rules:
-                plugin_id = rule.get('id')
-                if plugin_id in blacklist:
-                    continue
-                if (plugin_id not in alert_dict):
-                    pass_dict[plugin_id] = rule.get('name')
-
-            if min_level == zap_conf_lvls.index("PASS") and detailed_output:
-                for key, rule in sorted(pass_dict.items()):
-                    print('PASS: ' + rule + ' [' + key + ']')
+            if min_level == pass_level and detailed_output:
+                sys.stdout.write(''.join('PASS: ' + rule + ' [' + key + ']\n' for key, rule in sorted(pass_dict.items())))
 
             pass_count = len(pass_dict)
 
@@ -517,21 +529,13 @@ def main(argv):
             fail_count, fail_inprog_count = print_rules(alert_dict, 'FAIL', config_dict, config_msg, min_level,
                 inc_fail_rules, True, detailed_output, in_progress_issues)
 
-            if report_html:
-                # Save the report
-                write_report(base_dir + report_html, zap.core.htmlreport())
-
-            if report_json:
-                # Save the report
-                write_report(base_dir + report_json, zap._request_other(zap.base_other + 'core/other/jsonreport/'))
-
-            if report_md:
-                # Save the report
-                write_report(base_dir + report_md, zap.core.mdreport())
-
-            if report_xml:
-                # Save the report
-                write_report(base_dir + report_xml, zap.core.xmlreport())
+            # Save the requested reports, streaming them from ZAP concurrently
+            reports = [
+                (report_html, 'core/other/htmlreport/'),
+                (report_json, 'core/other/jsonreport/'),
+                (report_md, 'core/other/mdreport/'),
+                (report_xml, 'core/other/xmlreport/')]
+            write_reports(zap_ip, port, [(base_dir + report, zap.base_other + api) for (report, api) in reports if report])
 
             print('FAIL-NEW: ' + str(fail_count) + '\tFAIL-INPROG: ' + str(fail_inprog_count) +
                 '\tWARN-NEW: ' + str(warn_count) + '\tWARN-INPROG: ' + str(warn_inprog_count) +
@@ -555,7 +559,7 @@ def main(argv):
         logging.warning('Unexpected error: ' + str(sys.exc_info()[0]))
         dump_log_file(cid)
 
-    if not running_in_docker():
+    if not in_docker:
         stop_docker(cid)
 
     if fail_count > 0:
@@ -29,11 +29,20 @@ import sys
 import time
 import traceback
 import errno
+import requests
 import zapv2
+from multiprocessing.pool import ThreadPool
 from random import randint
+from requests.adapters import HTTPAdapter
 from six.moves.urllib.request import urlopen
 from six import binary_type
 
+try:
+    # orjson parses much faster, but is optional
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 try:
     import pkg_resources
 except ImportError:
@@ -110,13 +119,14 @@ def print_rules(alert_dict, level, config_dict, config_msg, min_level, inc_rule,
     # print out the ignored rules
     count = 0
     inprog_count = 0
+    level_index = zap_conf_lvls.index(level)
     for key, alert_list in sorted(alert_dict.items()):
         #if (config_dict.has_key(key) and config_dict[key] == level):
         if inc_rule(config_dict, key, inc_extra):
             user_msg = ''
             if key in config_msg:
                 user_msg = config_msg[key]
-            if min_level <= zap_conf_lvls.index(level):
+            if min_level <= level_index:
                 print_rule(level, alert_list, detailed_output, user_msg, in_progress_issues)
             if key in in_progress_issues:
                 inprog_count += 1
@@ -151,14 +161,14 @@ def dump_log_file(cid):
                 for line in zlog:
                     sys.stderr.write(line)
         else:
-            logging.debug('Failed to find zap_log ' + zap_log)
+            logging.debug('Failed to find zap_log %s', zap_log)
     else:
         logging.debug('Dumping docker logs')
         subprocess.call(["docker", "logs", cid], stdout=sys.stderr)
 
 
 def cp_to_docker(cid, file, dir):
-    logging.debug ('Copy ' + file)
+    logging.debug ('Copy %s', file)
     params = ['docker', 'cp', file, cid + ':' + dir + file]
     logging.debug (subprocess.check_output(params))
 
@@ -191,8 +201,8 @@ def wait_for_zap_start(zap, timeout_in_secs = 600):
     for x in range(0, timeout_in_secs):
         try:
             version = zap.core.version
-            logging.debug('ZAP Version ' + version)
-            logging.debug('Took ' + str(x) + ' seconds')
+            logging.debug('ZAP Version %s', version)
+            logging.debug('Took %d seconds', x)
             break
         except IOError:
             time.sleep(1)
@@ -205,7 +215,7 @@ def wait_for_zap_start(zap, timeout_in_secs = 600):
 
 def start_docker_zap(docker_image, port, extra_zap_params, mount_dir):
     try:
-        logging.debug('Pulling ZAP Docker image: ' + docker_image)
+        logging.debug('Pulling ZAP Docker image: %s', docker_image)
         ls_output = subprocess.check_output(['docker', 'pull', docker_image])
     except OSError as err:
         logging.warning('Failed to run docker - is it on your path?')
@@ -233,7 +243,7 @@ def start_docker_zap(docker_image, port, extra_zap_params, mount_dir):
     logging.info('Params: ' + str(params))
 
     cid = subprocess.check_output(params).rstrip().decode('utf-8')
-    logging.debug('Docker CID: ' + cid)
+    logging.debug('Docker CID: %s', cid)
     return cid
 
 
@@ -270,6 +280,37 @@ def stop_docker(cid):
         logging.warning('Docker rm failed')
 
 
+def zap_session(zap_ip, port):
+    """ Returns a session which sends all its requests through ZAP, keeping the
+    connections to it alive and reusing them between requests
+    """
+    session = requests.Session()
+    proxy = 'http://' + zap_ip + ':' + str(port)
+    session.proxies = {'http': proxy, 'https': proxy}
+    # Everything goes through ZAP, so skip the per request environment proxy lookups
+    session.trust_env = False
+    session.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=0))
+    session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=0))
+    return session
+
+
+def zap_use_session(zap, session):
+    """ Makes the ZAP API client send its requests over the given zap_session() so the
+    connection to ZAP is kept alive and reused instead of being reopened for every call.
+    The session should only be used by the thread making the API calls.
+    """
+    def request_api(url, query=None):
+        # Replaces the client's version, which creates a new session (and so a new
+        # connection) for every call. The API key is disabled, so none is added.
+        if not url.startswith('http://zap/'):
+            raise ValueError('A non ZAP API url was specified ' + url)
+        return session.get(url, params=query)
+
+    zap._request_api = request_api
+    # Requests to the target are proxied through ZAP, which uses its own certificate
+    zap.urlopen = lambda url, *args, **kwargs: session.get(url, verify=False, *args, **kwargs).text
+
+
 def zap_access_target(zap, target):
     res = zap.urlopen(target)
     if res.startswith("ZAP Error"):
@@ -278,10 +319,10 @@ def zap_access_target(zap, target):
 
 def zap_spider(zap, target, authenticated=False):
     if authenticated:
-        logging.debug ('Authenticated spider ' + target)
+        logging.debug ('Authenticated spider %s', target)
         spider_scan_id = zap.spider.scan(target, contextname='auth')
     else:
-        logging.debug ('Spider ' + target)
+        logging.debug ('Spider %s', target)
         spider_scan_id = zap.spider.scan(target)
 
     time.sleep(5)
@@ -293,7 +334,7 @@ def zap_spider(zap, target, authenticated=False):
 
 
 def zap_ajax_spider(zap, target, max_time):
-    logging.debug('AjaxSpider ' + target)
+    logging.debug('AjaxSpider %s', target)
     if max_time:
         zap.ajaxSpider.set_option_max_duration(str(max_time))
     zap.ajaxSpider.scan(target)
@@ -306,7 +347,7 @@ def zap_ajax_spider(zap, target, max_time):
 
 
 def zap_active_scan(zap, target, policy):
-    logging.debug('Active Scan ' + target + ' with policy ' + policy)
+    logging.debug('Active Scan %s with policy %s', target, policy)
     ascan_scan_id = zap.ascan.scan(target, recurse=True, scanpolicyname=policy)
     time.sleep(5)
 
@@ -343,7 +384,7 @@ def zap_get_alerts(zap, baseurl, blacklist, out_of_scope_dict):
     alert_count = 0
     alerts = zap.core.alerts(baseurl=baseurl, start=st, count=pg)
     while len(alerts) > 0:
-        logging.debug('Reading ' + str(pg) + ' alerts from ' + str(st))
+        logging.debug('Reading %d alerts from %d', pg, st)
         alert_count += len(alerts)
         for alert in alerts:
             plugin_id = alert.get('pluginId')
@@ -359,7 +400,7 @@ def zap_get_alerts(zap, baseurl, blacklist, out_of_scope_dict):
             alert_dict[plugin_id].append(alert)
         st += pg
         alerts = zap.core.alerts(start=st, count=pg)
-    logging.debug('Total number of alerts: ' + str(alert_count))
+    logging.debug('Total number of alerts: %d', alert_count)
     return alert_dict
 
 
@@ -417,3 +458,49 @@ def write_report(file_path, report):
             report = report.encode('utf-8')
 
         f.write(report)
+
+
+def stream_report(zap_ip, port, file_path, url):
+    """ Streams the ZAP report at url straight to file_path without holding it all in memory.
+    Returns file_path, or None if the report could not be written.
+    """
+    # requests sessions aren't documented as thread safe, so each report uses its own
+    session = zap_session(zap_ip, port)
+    # written alongside and only renamed once complete, so a failed download never
+    # leaves a truncated report or destroys one from an earlier run
+    part_path = file_path + '.part'
+    try:
+        response = session.get(url, stream=True)
+        try:
+            response.raise_for_status()
+            with open(part_path, mode='wb') as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+        finally:
+            response.close()
+        os.rename(part_path, file_path)
+    except (IOError, OSError) as e:
+        # one failed report shouldn't lose the results of the scan
+        logging.warning('Failed to write report %s: %s', file_path, e)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return None
+    finally:
+        session.close()
+    return file_path
+
+
+def write_reports(zap_ip, port, reports):
+    """ Streams the reports from ZAP to disk concurrently, waiting for them all to be written
+    reports - a list of (file_path, ZAP API url of the report) tuples
+    """
+    if not reports:
+        return
+    pool = ThreadPool(len(reports))
+    try:
+        for file_path in pool.imap_unordered(lambda report: stream_report(zap_ip, port, *report), reports):
+            if file_path:
+                logging.debug('Written report %s', file_path)
+    finally:
+        pool.terminate()
+        pool.join()